@@ -16,14 +16,28 @@
 #
 
 import argparse
+import concurrent.futures
+import functools
+import hashlib
+import io
 import json
 import os.path
+import pickle
 import subprocess
-from collections import defaultdict
+import sys
+import types
+from collections import deque
 from datetime import datetime
 
 from pyclibrary import CParser
 
+try:
+    # Optional: a C-extension JSON parser, noticeably faster than the stdlib on large
+    # annotation files. Falls back to the stdlib json module when not installed.
+    import orjson
+except ImportError:
+    orjson = None
+
 LICENSE_HEADER = """/*
  * Copyright (C) 2020 The Android Open Source Project
  *
@@ -45,7 +59,23 @@ LICENSE_HEADER = """/*
 CHPP_PARSER_INCLUDE_PATH = "chpp/include/chpp/common"
 CHPP_PARSER_SOURCE_PATH = "chpp/common"
 
+# Constant portions of the per-file autogen notice, assembled once at import time. The
+# timestamp is taken at module load, so every file generated in one run carries the same date.
+_AUTOGEN_NOTICE_PREFIX = (
+    f"// This file was automatically generated by {os.path.basename(__file__)}\n"
+    f"// Date: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC\n")
+_AUTOGEN_NOTICE_SUFFIX = (
+    "// DO NOT modify this file directly, as those changes will be lost the next\n"
+    "// time the script is executed\n\n")
+
+
+@functools.lru_cache(maxsize=1)
+def _get_commit_hash():
+    """Gets a description of the current commit, invoking git only on the first call."""
+    return subprocess.getoutput("git describe --always --long --dirty --exclude '*'")
 
+
+@functools.lru_cache(maxsize=1)
 def system_chre_abs_path():
     """Gets the absolute path to the system/chre directory containing this script."""
     script_dir = os.path.dirname(os.path.realpath(__file__))
@@ -58,47 +88,98 @@ class CodeGenerator:
     """Given an ApiParser object, generates a header file with structure definitions in CHPP format.
     """
 
-    def __init__(self, api, commit_hash):
+    def __init__(self, api):
         """
         :param api: ApiParser object
         """
         self.api = api
         self.json = api.json
         # Turn "chre_api/include/chre_api/chre/wwan.h" into "wwan"
-        self.service_name = self.json['filename'].split('/')[-1].split('.')[0]
+        self.service_name = os.path.splitext(os.path.basename(self.json['filename']))[0]
         self.capitalized_service_name = self.service_name[0].upper() + self.service_name[1:]
-        self.commit_hash = commit_hash
+        self.commit_hash = _get_commit_hash()
+        # Output files awaiting a single batched clang-format pass (see flush_clang_format())
+        self._pending_format_files = []
+        # Memoization caches for pure type-name lookups that would otherwise re-scan the
+        # annotation lists on every call
+        self._chpp_type_cache = {}
+        self._prefix_cache = {}
+        self._member_type_cache = {}
+        self._prepare_members()
+
+    def _prepare_members(self):
+        """Precomputes per-member lookup tables used throughout generation.
+
+        Adds to each member in self.api.structs_and_unions:
+          - '_ann_by_name': dict keyed by annotation name, so consumers can do an O(1)
+            lookup instead of linearly scanning the annotation list
+          - '_is_array': result of _is_array_type on the member's type
+        """
+        for struct_info in self.api.structs_and_unions.values():
+            for member_info in struct_info['members']:
+                member_info['_ann_by_name'] = {
+                    annotation['annotation']: annotation
+                    for annotation in member_info['annotations']
+                }
+                member_info['_is_array'] = self._is_array_type(member_info['type'])
+
+        # Tag each member with the assignment strategy it needs, so
+        # _get_assignment_statement_for_field can dispatch on a single precomputed value.
+        # Done in a second pass since it depends on has_vla_member of other types.
+        for struct_info in self.api.structs_and_unions.values():
+            for member_info in struct_info['members']:
+                if member_info['is_nested_type']:
+                    nested_type = member_info['nested_type_name']
+                    if self.api.structs_and_unions[nested_type]['has_vla_member']:
+                        member_info['_kind'] = 'nested_vla'
+                    else:
+                        member_info['_kind'] = 'nested_novla'
+                elif member_info['_is_array']:
+                    member_info['_kind'] = 'array_prim'
+                else:
+                    member_info['_kind'] = 'scalar'
+
+        # Sort each type's dependency set once up front; _sorted_structs walks these lists
+        self._sorted_deps = {
+            type_name: sorted(type_info['dependencies'])
+            for type_name, type_info in self.api.structs_and_unions.items()
+        }
 
     # ----------------------------------------------------------------------------------------------
     # Header generation methods (plus some methods shared with encoder generation)
     # ----------------------------------------------------------------------------------------------
 
-    def _autogen_notice(self):
-        out = []
-        out.append("// This file was automatically generated by {}\n".format(
-            os.path.basename(__file__)))
-        out.append("// Date: {} UTC\n".format(datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')))
-        out.append("// Source: {} @ commit {}\n\n".format(self.json['filename'], self.commit_hash))
-        out.append("// DO NOT modify this file directly, as those changes will be lost the next\n")
-        out.append("// time the script is executed\n\n")
-        return out
+    def _autogen_notice(self, out):
+        out.write(_AUTOGEN_NOTICE_PREFIX)
+        out.write(f"// Source: {self.json['filename']} @ commit {self.commit_hash}\n\n")
+        out.write(_AUTOGEN_NOTICE_SUFFIX)
 
     def _dump_to_file(self, output_filename, contents, dry_run, skip_clang_fomat):
         """Outputs contents to output_filename, or prints contents if dry_run is True"""
         if dry_run:
-            print("---- {} ----".format(output_filename))
+            print(f"---- {output_filename} ----")
             print(contents)
-            print("---- end of {} ----\n".format(output_filename))
+            print(f"---- end of {output_filename} ----\n")
         else:
+            # If the file already holds exactly this content, leave it alone - rewriting it
+            # would only bump the mtime (triggering downstream recompilation) and queue a
+            # pointless clang-format run
+            try:
+                with open(output_filename, 'r') as f:
+                    if f.read() == contents:
+                        return
+            except OSError:
+                pass
+
             with open(output_filename, 'w') as f:
                 f.write(contents)
 
             if not skip_clang_fomat:
-                clang_format_path = os.path.normpath(
-                    "../../../../prebuilts/clang/host/linux-x86/clang-stable/bin/clang-format")
-                args = [clang_format_path, '-i', output_filename]
-                result = subprocess.run(args)
-                result.check_returncode()
+                self._pending_format_files.append(output_filename)
+
+    def pending_format_files(self):
+        """Returns the output files written so far that still need a clang-format pass."""
+        return self._pending_format_files
 
     def _is_array_type(self, type_info):
         # If this is an array type, declarators will be a tuple containing a list of
@@ -108,39 +189,50 @@ class CodeGenerator:
     def _get_array_len(self, type_info):
         return type_info.declarators[0][0]
 
-    def _get_chpp_type_from_chre(self, chre_type):
+    def _get_chpp_type_from_chre(self, chre_type: str) -> str:
         """Given 'chreWwanCellInfo' returns 'struct ChppWwanCellInfo', etc."""
+        result = self._chpp_type_cache.get(chre_type)
+        if result is not None:
+            return result
+
         prefix = self._get_struct_or_union_prefix(chre_type)
 
         # First see if we have an explicit name override (e.g. for anonymous types)
-        for annotation in self.api.annotations[chre_type]["."]:
+        result = None
+        for annotation in self.api.annotations.get((chre_type, "."), ()):
             if annotation['annotation'] == "rename_type":
-                return prefix + annotation['type_override']
-
-        # Otherwise, use the existing type name, just replace the "chre" prefix with "Chpp"
-        if chre_type.startswith('chre'):
-            return prefix + 'Chpp' + chre_type[4:]
+                result = prefix + annotation['type_override']
+                break
         else:
-            raise RuntimeError("Couldn't figure out new type name for {}".format(chre_type))
+            # Otherwise, use the existing type name, just replace the "chre" prefix with "Chpp"
+            if chre_type.startswith('chre'):
+                result = prefix + 'Chpp' + chre_type[4:]
+            else:
+                raise RuntimeError(f"Couldn't figure out new type name for {chre_type}")
 
-    def _get_chre_type_with_prefix(self, chre_type):
+        self._chpp_type_cache[chre_type] = result
+        return result
+
+    def _get_chre_type_with_prefix(self, chre_type: str) -> str:
         """Given 'chreWwanCellInfo' returns 'struct chreWwanCellInfo', etc."""
         return self._get_struct_or_union_prefix(chre_type) + chre_type
 
-    def _get_chpp_header_type_from_chre(self, chre_type):
+    def _get_chpp_header_type_from_chre(self, chre_type: str) -> str:
         """Given 'chreWwanCellInfo' returns 'struct ChppWwanCellInfoWithHeader', etc."""
         return self._get_chpp_type_from_chre(chre_type) + 'WithHeader'
 
-    def _get_member_comment(self, member_info):
-        for annotation in member_info['annotations']:
-            if annotation['annotation'] == "fixed_value":
-                return "  // Input ignored; always set to {}".format(annotation['value'])
-            elif annotation['annotation'] == "var_len_array":
-                return "  // References {} instances of {}".format(
-                    annotation['length_field'], self._get_member_type(member_info))
+    def _get_member_comment(self, member_info: dict) -> str:
+        ann_by_name = member_info['_ann_by_name']
+        annotation = ann_by_name.get("fixed_value")
+        if annotation is not None:
+            return f"  // Input ignored; always set to {annotation['value']}"
+        annotation = ann_by_name.get("var_len_array")
+        if annotation is not None:
+            return (f"  // References {annotation['length_field']} instances of "
+                    f"{self._get_member_type(member_info)}")
         return ""
 
-    def _get_member_type(self, member_info, underlying_vla_type=False):
+    def _get_member_type(self, member_info: dict, underlying_vla_type: bool = False) -> str:
         """Gets the CHPP type specification prefix for a struct/union member.
 
         :param member_info: a dict element from self.api.structs_and_unions[struct]['members']
@@ -148,91 +240,98 @@ class CodeGenerator:
             'struct ChppOffset', and True to output the type that ChppOffset references
         :return: type specification string that prefixes the field name, e.g. 'uint8_t'
         """
+        cache_key = (id(member_info), underlying_vla_type)
+        result = self._member_type_cache.get(cache_key)
+        if result is not None:
+            return result
+
         # 4 cases to handle:
         #   1) Annotation gives explicit type that we should use
         #   2) Annotation says this is a variable length array (so use ChppOffset if
         #      underlying_vla_type is False)
         #   3) This is a struct/union type, so use the renamed (CHPP) type name
         #   4) Regular type, e.g. uint32_t, so just use the type spec as-is
-        for annotation in member_info['annotations']:
-            if annotation['annotation'] == "rewrite_type":
-                return annotation['type_override']
-            elif not underlying_vla_type and annotation['annotation'] in ["var_len_array", "string"]:
-                return "struct ChppOffset"
-
-        if not underlying_vla_type and len(member_info['type'].declarators) > 0 and \
-                member_info['type'].declarators[0] == "*":
-            # This case should either be handled by rewrite_type (e.g. to uint32_t as
-            # opaque/ignored), or var_len_array
-            raise RuntimeError("Pointer types require annotation\n{}".format(
-                member_info))
-
-        if member_info['is_nested_type']:
-            return self._get_chpp_type_from_chre(member_info['nested_type_name'])
+        ann_by_name = member_info['_ann_by_name']
+        result = None
+        annotation = ann_by_name.get("rewrite_type")
+        if annotation is not None:
+            result = annotation['type_override']
+        elif not underlying_vla_type and \
+                ("var_len_array" in ann_by_name or "string" in ann_by_name):
+            result = "struct ChppOffset"
+
+        if result is None:
+            if not underlying_vla_type and len(member_info['type'].declarators) > 0 and \
+                    member_info['type'].declarators[0] == "*":
+                # This case should either be handled by rewrite_type (e.g. to uint32_t as
+                # opaque/ignored), or var_len_array
+                raise RuntimeError(f"Pointer types require annotation\n{member_info}")
+
+            if member_info['is_nested_type']:
+                result = self._get_chpp_type_from_chre(member_info['nested_type_name'])
+            else:
+                result = member_info['type'].type_spec
 
-        return member_info['type'].type_spec
+        self._member_type_cache[cache_key] = result
+        return result
 
-    def _get_member_type_suffix(self, member_info):
-        if self._is_array_type(member_info['type']):
-            return "[{}]".format(self._get_array_len(member_info['type']))
+    def _get_member_type_suffix(self, member_info: dict) -> str:
+        if member_info['_is_array']:
+            return f"[{self._get_array_len(member_info['type'])}]"
         return ""
 
-    def _get_struct_or_union_prefix(self, chre_type):
-        return 'struct ' if not self.api.structs_and_unions[chre_type]['is_union'] else 'union '
+    def _get_struct_or_union_prefix(self, chre_type: str) -> str:
+        result = self._prefix_cache.get(chre_type)
+        if result is None:
+            result = 'struct ' if not self.api.structs_and_unions[chre_type]['is_union'] \
+                else 'union '
+            self._prefix_cache[chre_type] = result
+        return result
 
-    def _gen_header_includes(self):
+    def _gen_header_includes(self, out):
         """Generates #include directives for use in <service>_types.h"""
-        out = ["#include <stdbool.h>\n#include <stddef.h>\n#include <stdint.h>\n\n"]
+        out.write("#include <stdbool.h>\n#include <stddef.h>\n#include <stdint.h>\n\n")
 
         includes = ["chpp/app.h", "chpp/macros.h", "chre_api/chre/version.h"]
         includes.extend(self.json['output_includes'])
         for incl in sorted(includes):
-            out.append("#include \"{}\"\n".format(incl))
-        out.append("\n")
-        return out
+            out.write(f"#include \"{incl}\"\n")
+        out.write("\n")
 
-    def _gen_struct_or_union(self, name):
+    def _gen_struct_or_union(self, out, name):
         """Generates the definition for a single struct/union type"""
-        out = []
         if not name.startswith('anon'):
-            out.append("//! See {{@link {}}} for details\n".format(name))
-        out.append("{} {{\n".format(self._get_chpp_type_from_chre(name)))
+            out.write(f"//! See {{@link {name}}} for details\n")
+        out.write(f"{self._get_chpp_type_from_chre(name)} {{\n")
         for member_info in self.api.structs_and_unions[name]['members']:
-            out.append("  {} {}{};{}\n".format(self._get_member_type(member_info),
-                                               member_info['name'],
-                                               self._get_member_type_suffix(member_info),
-                                               self._get_member_comment(member_info)))
+            out.write(f"  {self._get_member_type(member_info)} {member_info['name']}"
+                      f"{self._get_member_type_suffix(member_info)};"
+                      f"{self._get_member_comment(member_info)}\n")
 
-        out.append("} CHPP_PACKED_ATTR;\n\n")
-        return out
+        out.write("} CHPP_PACKED_ATTR;\n\n")
 
-    def _gen_header_struct(self, chre_type):
+    def _gen_header_struct(self, out, chre_type):
         """Generates the definition for the type with header (WithHeader)"""
-        out = []
-        out.append("//! CHPP app header plus {}\n".format(
-            self._get_chpp_header_type_from_chre(chre_type)))
-
-        out.append("{} {{\n".format(self._get_chpp_header_type_from_chre(chre_type)))
-        out.append("  struct ChppAppHeader header;\n")
-        out.append("  {} payload;\n".format(self._get_chpp_type_from_chre(chre_type)))
-        out.append("} CHPP_PACKED_ATTR;\n\n")
+        out.write(f"//! CHPP app header plus {self._get_chpp_header_type_from_chre(chre_type)}\n")
 
-        return out
+        out.write(f"{self._get_chpp_header_type_from_chre(chre_type)} {{\n")
+        out.write("  struct ChppAppHeader header;\n")
+        out.write(f"  {self._get_chpp_type_from_chre(chre_type)} payload;\n")
+        out.write("} CHPP_PACKED_ATTR;\n\n")
 
-    def _gen_structs_and_unions(self):
+    def _gen_structs_and_unions(self, out):
         """Generates definitions for all struct/union types required for the root structs."""
-        out = []
-        out.append("CHPP_PACKED_START\n\n")
+        out.write("CHPP_PACKED_START\n\n")
 
-        sorted_structs = self._sorted_structs(self.json['root_structs'])
+        root_structs = self.json['root_structs']
+        sorted_structs = self._sorted_structs(root_structs)
         for type_name in sorted_structs:
-            out.extend(self._gen_struct_or_union(type_name))
+            self._gen_struct_or_union(out, type_name)
 
-        for chre_type in self.json['root_structs']:
-            out.extend(self._gen_header_struct(chre_type))
+        for chre_type in root_structs:
+            self._gen_header_struct(out, chre_type)
 
-        out.append("CHPP_PACKED_END\n\n")
-        return out
+        out.write("CHPP_PACKED_END\n\n")
 
     def _sorted_structs(self, root_nodes):
         """Implements a topological sort on self.api.structs_and_unions.
@@ -244,22 +343,27 @@ class CodeGenerator:
         result = []
         visited = set()
 
-        def sort_helper(collection, key):
-            for dep in sorted(collection[key]['dependencies']):
-                if dep not in visited:
-                    visited.add(dep)
-                    sort_helper(collection, dep)
-            result.append(key)
-
+        # Iterative post-order DFS: each stack entry holds a node and an iterator over its
+        # (pre-sorted) dependencies; a node is emitted once all its dependencies have been
         for node in sorted(root_nodes):
-            sort_helper(self.api.structs_and_unions, node)
+            stack = [(node, iter(self._sorted_deps[node]))]
+            while stack:
+                key, deps = stack[-1]
+                for dep in deps:
+                    if dep not in visited:
+                        visited.add(dep)
+                        stack.append((dep, iter(self._sorted_deps[dep])))
+                        break
+                else:
+                    result.append(key)
+                    stack.pop()
         return result
 
     # ----------------------------------------------------------------------------------------------
     # Encoder function generation methods (CHRE --> CHPP)
     # ----------------------------------------------------------------------------------------------
 
-    def _get_chpp_member_sizeof_call(self, member_info):
+    def _get_chpp_member_sizeof_call(self, member_info: dict) -> str:
         """Returns invocation used to determine the size of the provided member when encoded.
 
         Will be either sizeof(<type in CHPP struct>) or a function call if the member contains a VLA
@@ -270,176 +374,154 @@ class CodeGenerator:
         if member_info['is_nested_type']:
             chre_type = member_info['nested_type_name']
             if self.api.structs_and_unions[chre_type]['has_vla_member']:
-                return "{}(in->{})".format(self._get_chpp_sizeof_function_name(chre_type),
-                                           member_info['name'])
+                return (f"{self._get_chpp_sizeof_function_name(chre_type)}"
+                        f"(in->{member_info['name']})")
             else:
                 type_name = self._get_chpp_type_from_chre(chre_type)
         else:
             type_name = member_info['type'].type_spec
-        return "sizeof({})".format(type_name)
+        return f"sizeof({type_name})"
 
-    def _gen_chpp_sizeof_function(self, chre_type):
+    def _gen_chpp_sizeof_function(self, out, chre_type):
         """Generates a function to determine the encoded size of the CHRE struct, if necessary."""
-        out = []
-
         # Note that this function *should* work with unions as well, but at the time of writing
         # it'll only be used with structs, so names, etc. are written with that in mind
         struct_info = self.api.structs_and_unions[chre_type]
         if not struct_info['has_vla_member']:
             # No codegen necessary, just sizeof on the CHPP structure name is sufficient
-            return out
+            return
 
         core_type_name = self._strip_prefix_and_service_from_chre_struct_name(chre_type)
         parameter_name = core_type_name[0].lower() + core_type_name[1:]
         chpp_type_name = self._get_chpp_header_type_from_chre(chre_type)
-        out.append("//! @return number of bytes required to represent the given\n"
-                   "//! {} along with the CHPP header as\n"
-                   "//! {}\n"
-                   .format(chre_type, chpp_type_name))
-        out.append("static size_t {}(\n        const {}{} *{}) {{\n"
-                   .format(self._get_chpp_sizeof_function_name(chre_type),
-                           self._get_struct_or_union_prefix(chre_type), chre_type,
-                           parameter_name))
+        out.write("//! @return number of bytes required to represent the given\n"
+                  f"//! {chre_type} along with the CHPP header as\n"
+                  f"//! {chpp_type_name}\n")
+        out.write(f"static size_t {self._get_chpp_sizeof_function_name(chre_type)}(\n"
+                  f"        const {self._get_struct_or_union_prefix(chre_type)}{chre_type}"
+                  f" *{parameter_name}) {{\n")
 
         # sizeof(this struct)
-        out.append("  size_t encodedSize = sizeof({});\n".format(chpp_type_name))
+        out.write(f"  size_t encodedSize = sizeof({chpp_type_name});\n")
 
         # Plus count * sizeof(type) for each var-len array included in this struct
-        for member_info in self.api.structs_and_unions[chre_type]['members']:
-            for annotation in member_info['annotations']:
-                if annotation['annotation'] == "var_len_array":
-                    # If the VLA field itself contains a VLA, then we'd need to generate a for
-                    # loop to calculate the size of each element individually - I don't think we
-                    # have any of these in the CHRE API today, so leaving this functionality out.
-                    # Also note that to support that case we'd also want to recursively call this
-                    # function to generate sizeof functions for nested fields.
-                    if member_info['is_nested_type'] and \
-                            self.api.structs_and_unions[member_info['nested_type_name']][
-                                'has_vla_member']:
-                        raise RuntimeError(
-                            "Nested variable-length arrays is not currently supported ({} "
-                            "in {})".format(member_info['name'], chre_type))
-
-                    out.append("  encodedSize += {}->{} * sizeof({});\n".format(
-                        parameter_name, annotation['length_field'],
-                        self._get_member_type(member_info, True)))
-                elif annotation['annotation'] == "string":
-                    out.append("  if ({}->{} != NULL) {{".format(
-                        parameter_name, annotation['field']))
-                    out.append("    encodedSize += strlen({}->{}) + 1;\n".format(
-                        parameter_name, annotation['field']))
-                    out.append("  }\n")
-
-        out.append("  return encodedSize;\n}\n\n")
-        return out
-
-    def _gen_chpp_sizeof_functions(self):
+        for member_info in struct_info['members']:
+            ann_by_name = member_info['_ann_by_name']
+            annotation = ann_by_name.get("var_len_array")
+            if annotation is not None:
+                # If the VLA field itself contains a VLA, then we'd need to generate a for
+                # loop to calculate the size of each element individually - I don't think we
+                # have any of these in the CHRE API today, so leaving this functionality out.
+                # Also note that to support that case we'd also want to recursively call this
+                # function to generate sizeof functions for nested fields.
+                if member_info['is_nested_type'] and \
+                        self.api.structs_and_unions[member_info['nested_type_name']][
+                            'has_vla_member']:
+                    raise RuntimeError(
+                        f"Nested variable-length arrays is not currently supported "
+                        f"({member_info['name']} in {chre_type})")
+
+                out.write(f"  encodedSize += {parameter_name}->{annotation['length_field']}"
+                          f" * sizeof({self._get_member_type(member_info, True)});\n")
+            else:
+                annotation = ann_by_name.get("string")
+                if annotation is not None:
+                    out.write(f"  if ({parameter_name}->{annotation['field']} != NULL) {{")
+                    out.write(f"    encodedSize += strlen({parameter_name}->"
+                              f"{annotation['field']}) + 1;\n")
+                    out.write("  }\n")
+
+        out.write("  return encodedSize;\n}\n\n")
+
+    def _gen_chpp_sizeof_functions(self, out):
         """For each root struct, generate necessary functions to determine their encoded size."""
-        out = []
         for struct in self.json['root_structs']:
-            out.extend(self._gen_chpp_sizeof_function(struct))
-        return out
+            self._gen_chpp_sizeof_function(out, struct)
 
-    def _gen_conversion_includes(self):
+    def _gen_conversion_includes(self, out):
         """Generates #include directives for the conversion source file"""
-        out = ["#include \"chpp/macros.h\"\n"
-               "#include \"chpp/memory.h\"\n"
-               "#include \"chpp/common/{}_types.h\"\n\n".format(self.service_name)]
-        out.append("#include <stddef.h>\n#include <stdint.h>\n#include <string.h>\n\n")
-        return out
+        out.write("#include \"chpp/macros.h\"\n"
+                  "#include \"chpp/memory.h\"\n"
+                  f"#include \"chpp/common/{self.service_name}_types.h\"\n\n")
+        out.write("#include <stddef.h>\n#include <stdint.h>\n#include <string.h>\n\n")
 
-    def _get_chpp_sizeof_function_name(self, chre_struct):
+    def _get_chpp_sizeof_function_name(self, chre_struct: str) -> str:
         """Function name used to compute the encoded size of the given struct at runtime"""
         core_type_name = self._strip_prefix_and_service_from_chre_struct_name(chre_struct)
-        return "chpp{}SizeOf{}FromChre".format(self.capitalized_service_name, core_type_name)
+        return f"chpp{self.capitalized_service_name}SizeOf{core_type_name}FromChre"
 
-    def _get_encoding_function_name(self, chre_type):
+    def _get_encoding_function_name(self, chre_type: str) -> str:
         core_type_name = self._strip_prefix_and_service_from_chre_struct_name(chre_type)
-        return "chpp{}Convert{}FromChre".format(self.capitalized_service_name, core_type_name)
-
-    def _gen_encoding_function_signature(self, chre_type):
-        out = []
-        out.append("void {}(\n".format(self._get_encoding_function_name(chre_type)))
-        out.append("    const {}{} *in,\n".format(
-            self._get_struct_or_union_prefix(chre_type), chre_type))
-        out.append("    {} *out".format(self._get_chpp_type_from_chre(chre_type)))
+        return f"chpp{self.capitalized_service_name}Convert{core_type_name}FromChre"
+
+    def _gen_encoding_function_signature(self, out, chre_type):
+        out.write(f"void {self._get_encoding_function_name(chre_type)}(\n")
+        out.write(f"    const {self._get_struct_or_union_prefix(chre_type)}{chre_type} *in,\n")
+        out.write(f"    {self._get_chpp_type_from_chre(chre_type)} *out")
         if self.api.structs_and_unions[chre_type]['has_vla_member']:
-            out.append(",\n")
-            out.append("    uint8_t *payload,\n")
-            out.append("    size_t payloadSize,\n")
-            out.append("    uint16_t *vlaOffset")
-        out.append(")")
-        return out
-
-    def _gen_string_encoding(self, member_info, annotation):
-        out = []
+            out.write(",\n")
+            out.write("    uint8_t *payload,\n")
+            out.write("    size_t payloadSize,\n")
+            out.write("    uint16_t *vlaOffset")
+        out.write(")")
+
+    def _gen_string_encoding(self, out, member_info, annotation):
         # Might want to revisit this if we ever end up supporting NULL strings
         # in our API. We can assert here since there's currently no API that
         # does so.
         member_name = member_info['name']
-        out.append("  if (in->{} != NULL) {{\n".format(member_name))
-        out.append("    size_t strSize = strlen(in->{}) + 1;\n".format(member_name))
-        out.append("    memcpy(&payload[*vlaOffset], in->{}, strSize);\n".format(
-            member_name))
-        out.append("    out->{}.length = (uint16_t)(strSize);\n".format(
-            member_name))
-        out.append("    out->{}.offset = *vlaOffset;\n".format(member_name))
-        out.append("    *vlaOffset += out->{}.length;\n".format(member_name))
-        out.append("  } else {\n")
-        out.append("    out->{}.length = 0;\n".format(member_name))
-        out.append("    out->{}.offset = 0;\n".format(member_name))
-        out.append("  }\n\n")
-
-        return out
-
-    def _gen_vla_encoding(self, member_info, annotation):
-        out = []
-
+        out.write(f"  if (in->{member_name} != NULL) {{\n")
+        out.write(f"    size_t strSize = strlen(in->{member_name}) + 1;\n")
+        out.write(f"    memcpy(&payload[*vlaOffset], in->{member_name}, strSize);\n")
+        out.write(f"    out->{member_name}.length = (uint16_t)(strSize);\n")
+        out.write(f"    out->{member_name}.offset = *vlaOffset;\n")
+        out.write(f"    *vlaOffset += out->{member_name}.length;\n")
+        out.write("  } else {\n")
+        out.write(f"    out->{member_name}.length = 0;\n")
+        out.write(f"    out->{member_name}.offset = 0;\n")
+        out.write("  }\n\n")
+
+    def _gen_vla_encoding(self, out, member_info, annotation):
         variable_name = member_info['name']
         chpp_type = self._get_member_type(member_info, True)
 
         if member_info['is_nested_type']:
-            out.append("\n  {} *{} = ({} *) &payload[*vlaOffset];\n".format(
-                chpp_type, variable_name, chpp_type))
+            out.write(f"\n  {chpp_type} *{variable_name} = ({chpp_type} *) &payload[*vlaOffset];\n")
 
-        out.append("  out->{}.length = (uint16_t)(in->{} * {});\n".format(
-            member_info['name'], annotation['length_field'],
-            self._get_chpp_member_sizeof_call(member_info)))
+        out.write(f"  out->{member_info['name']}.length = "
+                  f"(uint16_t)(in->{annotation['length_field']} * "
+                  f"{self._get_chpp_member_sizeof_call(member_info)});\n")
 
-        out.append("  CHPP_ASSERT((size_t)(*vlaOffset + out->{}.length) <= payloadSize);\n".format(
-            member_info['name']))
+        out.write(f"  CHPP_ASSERT((size_t)(*vlaOffset + out->{member_info['name']}.length)"
+                  f" <= payloadSize);\n")
 
-        out.append("  if (out->{}.length > 0 &&\n"
-                   "      *vlaOffset + out->{}.length <= payloadSize) {{\n".format(
-            member_info['name'], member_info['name']))
+        out.write(f"  if (out->{member_info['name']}.length > 0 &&\n"
+                  f"      *vlaOffset + out->{member_info['name']}.length <= payloadSize) {{\n")
 
         if member_info['is_nested_type']:
-            out.append("    for (size_t i = 0; i < in->{}; i++) {{\n".format(
-                annotation['length_field']))
-            out.append("      {}".format(
-                self._get_assignment_statement_for_field(member_info, in_vla_loop=True)))
-            out.append("    }\n")
+            out.write(f"    for (size_t i = 0; i < in->{annotation['length_field']}; i++) {{\n")
+            assignment = self._get_assignment_statement_for_field(member_info, in_vla_loop=True)
+            out.write(f"      {assignment}")
+            out.write("    }\n")
         else:
-            out.append("memcpy(&payload[*vlaOffset], in->{}, in->{} * sizeof({}));\n".format(
-                member_info['name'], annotation['length_field'], chpp_type))
+            out.write(f"memcpy(&payload[*vlaOffset], in->{member_info['name']}, "
+                      f"in->{annotation['length_field']} * sizeof({chpp_type}));\n")
 
-        out.append("    out->{}.offset = *vlaOffset;\n".format(member_info['name']))
-        out.append("    *vlaOffset += out->{}.length;\n".format(member_info['name']))
+        out.write(f"    out->{member_info['name']}.offset = *vlaOffset;\n")
+        out.write(f"    *vlaOffset += out->{member_info['name']}.length;\n")
 
-        out.append("  } else {\n")
-        out.append("    out->{}.offset = 0;\n".format(member_info['name']))
-        out.append("  }\n");
-
-        return out
+        out.write("  } else {\n")
+        out.write(f"    out->{member_info['name']}.offset = 0;\n")
+        out.write("  }\n");
 
     # ----------------------------------------------------------------------------------------------
     # Encoder / decoder function generation methods (CHRE <--> CHPP)
     # ----------------------------------------------------------------------------------------------
 
-    def _get_assignment_statement_for_field(self, member_info,
-                                            in_vla_loop=False,
-                                            containing_field_name=None,
-                                            decode_mode=False):
+    def _get_assignment_statement_for_field(self, member_info: dict,
+                                            in_vla_loop: bool = False,
+                                            containing_field_name: str = None,
+                                            decode_mode: bool = False) -> str:
         """Returns a statement to assign the provided member
 
         :param member_info:
@@ -455,43 +537,40 @@ class CodeGenerator:
         output_accessor = "" if in_vla_loop else "out->"
         containing_field = containing_field_name + "." if containing_field_name is not None else ""
 
-        output_variable = "{}{}{}{}".format(output_accessor, containing_field, member_info['name'],
-                                            array_index)
-        input_variable = "in->{}{}{}".format(containing_field, member_info['name'], array_index)
+        output_variable = f"{output_accessor}{containing_field}{member_info['name']}{array_index}"
+        input_variable = f"in->{containing_field}{member_info['name']}{array_index}"
 
         if decode_mode and in_vla_loop:
-            output_variable = "{}Out{}".format(member_info['name'], array_index)
-            input_variable = "{}In{}".format(member_info['name'], array_index)
+            output_variable = f"{member_info['name']}Out{array_index}"
+            input_variable = f"{member_info['name']}In{array_index}"
 
-        if member_info['is_nested_type']:
+        kind = member_info['_kind']
+        if kind == 'nested_vla' or kind == 'nested_novla':
             chre_type = member_info['nested_type_name']
-            has_vla_member = self.api.structs_and_unions[chre_type]['has_vla_member']
+            has_vla_member = kind == 'nested_vla'
             if decode_mode:
                 # Use decoding function
                 vla_params = ", inSize" if has_vla_member else ""
-                out = "if (!{}(&{}, &{}{})) {{\n".format(
-                    self._get_decoding_function_name(chre_type), input_variable,
-                    output_variable, vla_params)
+                out = (f"if (!{self._get_decoding_function_name(chre_type)}"
+                       f"(&{input_variable}, &{output_variable}{vla_params})) {{\n")
                 if has_vla_member:
-                    out += "  CHPP_FREE_AND_NULLIFY({}Out);\n".format(member_info['name'])
+                    out += f"  CHPP_FREE_AND_NULLIFY({member_info['name']}Out);\n"
                 out += "  return false;\n"
                 out += "}\n"
                 return out
             else:
                 # Use encoding function
                 vla_params = ", payload, payloadSize, vlaOffset" if has_vla_member else ""
-                return "{}(&{}, &{}{});\n".format(
-                    self._get_encoding_function_name(chre_type), input_variable, output_variable,
-                    vla_params)
-        elif self._is_array_type(member_info['type']):
+                return (f"{self._get_encoding_function_name(chre_type)}"
+                        f"(&{input_variable}, &{output_variable}{vla_params});\n")
+        elif kind == 'array_prim':
             # Array of primitive type (e.g. uint32_t[8]) - use memcpy
-            return "memcpy({}, {}, sizeof({}));\n".format(output_variable, input_variable,
-                                                          output_variable)
+            return f"memcpy({output_variable}, {input_variable}, sizeof({output_variable}));\n"
         else:
             # Regular assignment
-            return "{} = {};\n".format(output_variable, input_variable)
+            return f"{output_variable} = {input_variable};\n"
 
-    def _gen_union_variant_conversion_code(self, member_info, annotation, decode_mode):
+    def _gen_union_variant_conversion_code(self, out, member_info, annotation, decode_mode):
         """Generates a switch statement to encode the "active"/"used" field within a union.
 
         Handles cases where a union has multiple types, but there's another peer/adjacent field
@@ -503,127 +582,113 @@ class CodeGenerator:
         :param chre_type: CHRE type of the union
         :param annotation: Reference to JSON annotation data with the discriminator mapping data
         :param decode_mode: False encodes from CHRE to CHPP. True decodes from CHPP to CHRE
-        :return: list of strings
         """
-        out = []
         chre_type = member_info['nested_type_name']
         struct_info = self.api.structs_and_unions[chre_type]
 
         # Start off by zeroing out the union field so any padding is set to a consistent value
-        out.append("  memset(&out->{}, 0, sizeof(out->{}));\n".format(member_info['name'],
-                                                                      member_info['name']))
+        out.write(f"  memset(&out->{member_info['name']}, 0, "
+                  f"sizeof(out->{member_info['name']}));\n")
 
         # Next, generate the switch statement that will copy over the proper values
-        out.append("  switch (in->{}) {{\n".format(annotation['discriminator']))
+        out.write(f"  switch (in->{annotation['discriminator']}) {{\n")
         for value, field_name in annotation['mapping']:
-            out.append("    case {}:\n".format(value))
+            out.write(f"    case {value}:\n")
 
             found = False
             for nested_member_info in struct_info['members']:
                 if nested_member_info['name'] == field_name:
-                    out.append("      {}".format(
-                        self._get_assignment_statement_for_field(
-                            nested_member_info,
-                            containing_field_name=member_info['name'],
-                            decode_mode=decode_mode)))
+                    assignment = self._get_assignment_statement_for_field(
+                        nested_member_info,
+                        containing_field_name=member_info['name'],
+                        decode_mode=decode_mode)
+                    out.write(f"      {assignment}")
                     found = True
                     break
 
             if not found:
-                raise RuntimeError("Invalid mapping - couldn't find target field {} in struct {}"
-                                   .format(field_name, chre_type))
+                raise RuntimeError(f"Invalid mapping - couldn't find target field "
+                                   f"{field_name} in struct {chre_type}")
 
-            out.append("      break;\n")
+            out.write("      break;\n")
 
-        out.append("    default:\n"
-                   "      CHPP_ASSERT(false);\n"
-                   "  }\n")
-
-        return out
-
-    def _gen_conversion_function(self, chre_type, already_generated, decode_mode):
-        out = []
+        out.write("    default:\n"
+                  "      CHPP_ASSERT(false);\n"
+                  "  }\n")
 
+    def _gen_conversion_function(self, out, chre_type, already_generated, decode_mode):
         struct_info = self.api.structs_and_unions[chre_type]
         for dependency in sorted(struct_info['dependencies']):
             if dependency not in already_generated:
-                out.extend(
-                    self._gen_conversion_function(dependency, already_generated, decode_mode))
+                self._gen_conversion_function(out, dependency, already_generated, decode_mode)
 
         # Skip if we've already generated code for this type, or if it's a union (in which case we
         # handle the assignment in the parent structure to enable support for discrimination of
         # which field in the union to use)
         if chre_type in already_generated or struct_info['is_union']:
-            return out
+            return
         already_generated.add(chre_type)
 
-        out.append("static ")
+        out.write("static ")
         if decode_mode:
-            out.extend(self._gen_decoding_function_signature(chre_type))
+            self._gen_decoding_function_signature(out, chre_type)
         else:
-            out.extend(self._gen_encoding_function_signature(chre_type))
-        out.append(" {\n")
-
-        for member_info in self.api.structs_and_unions[chre_type]['members']:
-            generated_by_annotation = False
-            for annotation in member_info['annotations']:
-                if annotation['annotation'] == "fixed_value":
-                    if self._is_array_type(member_info['type']):
-                        out.append("  memset(&out->{}, {}, sizeof(out->{}));\n".format(
-                            member_info['name'], annotation['value'], member_info['name']))
-                    else:
-                        out.append("  out->{} = {};\n".format(member_info['name'],
-                                                              annotation['value']))
-                    generated_by_annotation = True
-                    break
-                elif annotation['annotation'] == "enum":
-                    # TODO: generate range verification code?
-                    pass
-                elif annotation['annotation'] == "var_len_array":
-                    if decode_mode:
-                        out.extend(self._gen_vla_decoding(member_info, annotation))
-                    else:
-                        out.extend(self._gen_vla_encoding(member_info, annotation))
-                    generated_by_annotation = True
-                    break
-                elif annotation['annotation'] == "string":
-                    if decode_mode:
-                        out.extend(self._gen_string_decoding(member_info, annotation))
-                    else:
-                        out.extend(self._gen_string_encoding(member_info, annotation))
-                    generated_by_annotation = True
-                    break
-                elif annotation['annotation'] == "union_variant":
-                    out.extend(self._gen_union_variant_conversion_code(
-                        member_info, annotation, decode_mode))
-                    generated_by_annotation = True
-                    break
+            self._gen_encoding_function_signature(out, chre_type)
+        out.write(" {\n")
+
+        for member_info in struct_info['members']:
+            # Note: "enum" annotations are handled as a plain assignment
+            # TODO: generate range verification code?
+            ann_by_name = member_info['_ann_by_name']
+            generated_by_annotation = True
+            annotation = ann_by_name.get("fixed_value")
+            if annotation is not None:
+                if member_info['_is_array']:
+                    out.write(f"  memset(&out->{member_info['name']}, {annotation['value']}, "
+                              f"sizeof(out->{member_info['name']}));\n")
+                else:
+                    out.write(f"  out->{member_info['name']} = {annotation['value']};\n")
+            elif "var_len_array" in ann_by_name:
+                annotation = ann_by_name["var_len_array"]
+                if decode_mode:
+                    self._gen_vla_decoding(out, member_info, annotation)
+                else:
+                    self._gen_vla_encoding(out, member_info, annotation)
+            elif "string" in ann_by_name:
+                annotation = ann_by_name["string"]
+                if decode_mode:
+                    self._gen_string_decoding(out, member_info, annotation)
+                else:
+                    self._gen_string_encoding(out, member_info, annotation)
+            elif "union_variant" in ann_by_name:
+                self._gen_union_variant_conversion_code(
+                    out, member_info, ann_by_name["union_variant"], decode_mode)
+            else:
+                generated_by_annotation = False
 
             if not generated_by_annotation:
-                out.append("  {}".format(
-                    self._get_assignment_statement_for_field(member_info, decode_mode=decode_mode)))
+                assignment = self._get_assignment_statement_for_field(
+                    member_info, decode_mode=decode_mode)
+                out.write(f"  {assignment}")
 
         if decode_mode:
-            out.append("\n  return true;\n")
+            out.write("\n  return true;\n")
 
-        out.append("}\n\n")
-        return out
+        out.write("}\n\n")
 
-    def _gen_conversion_functions(self, decode_mode):
-        out = []
+    def _gen_conversion_functions(self, out, decode_mode):
         already_generated = set()
         for struct in self.json['root_structs']:
-            out.extend(self._gen_conversion_function(struct, already_generated, decode_mode))
-        return out
+            self._gen_conversion_function(out, struct, already_generated, decode_mode)
 
-    def _strip_prefix_and_service_from_chre_struct_name(self, struct):
+    def _strip_prefix_and_service_from_chre_struct_name(self, struct: str) -> str:
         """Strip 'chre' and service prefix, e.g. 'chreWwanCellResultInfo' -> 'CellResultInfo'"""
         chre_stripped = struct[4:]
         upcased_service_name = self.service_name[0].upper() + self.service_name[1:]
         if not struct.startswith('chre') or not chre_stripped.startswith(upcased_service_name):
             # If this happens, we need to update the script to handle it. Right we assume struct
             # naming follows the pattern "chre<Service_name><Thing_name>"
-            raise RuntimeError("Unexpected structure name {}".format(struct))
+            raise RuntimeError(f"Unexpected structure name {struct}")
 
         return chre_stripped[len(self.service_name):]
 
@@ -631,7 +696,7 @@ class CodeGenerator:
     # Memory allocation generation methods
     # ----------------------------------------------------------------------------------------------
 
-    def _get_chpp_sizeof_call(self, chre_type):
+    def _get_chpp_sizeof_call(self, chre_type: str) -> str:
         """Returns invocation used to determine the size of the provided CHRE struct (with the CHPP
         app header) after encoding.
 
@@ -641,124 +706,105 @@ class CodeGenerator:
         :return: string
         """
         if self.api.structs_and_unions[chre_type]['has_vla_member']:
-            return "{}(in)".format(self._get_chpp_sizeof_function_name(chre_type))
+            return f"{self._get_chpp_sizeof_function_name(chre_type)}(in)"
         else:
-            return "sizeof({})".format(self._get_chpp_header_type_from_chre(chre_type))
+            return f"sizeof({self._get_chpp_header_type_from_chre(chre_type)})"
 
-    def _get_encode_allocation_function_name(self, chre_type):
+    def _get_encode_allocation_function_name(self, chre_type: str) -> str:
         core_type_name = self._strip_prefix_and_service_from_chre_struct_name(chre_type)
-        return "chpp{}{}FromChre".format(self.capitalized_service_name, core_type_name)
+        return f"chpp{self.capitalized_service_name}{core_type_name}FromChre"
 
-    def _gen_encode_allocation_function_signature(self, chre_type, gen_docs=False):
-        out = []
+    def _gen_encode_allocation_function_signature(self, out, chre_type, gen_docs=False):
         if gen_docs:
-            out.append("/**\n"
-                       " * Converts from given CHRE structure to serialized CHPP type.\n"
-                       " *\n"
-                       " * @param in Fully-formed CHRE structure.\n"
-                       " * @param out Upon success, will point to a buffer allocated with "
-                       "chppMalloc().\n"
-                       " * It is the responsibility of the caller to set the values of the CHPP "
-                       "app layer header, and to free the buffer when it is no longer needed via "
-                       "chppFree() or CHPP_FREE_AND_NULLIFY().\n"
-                       " * @param outSize Upon success, will be set to the size of the output "
-                       "buffer, in bytes.\n"
-                       " *\n"
-                       " * @return true on success, false if memory allocation failed.\n"
-                       " */\n")
-        out.append("bool {}(\n".format(self._get_encode_allocation_function_name(chre_type)))
-        out.append("    const {}{} *in,\n".format(
-            self._get_struct_or_union_prefix(chre_type), chre_type))
-        out.append("    {} **out,\n".format(self._get_chpp_header_type_from_chre(chre_type)))
-        out.append("    size_t *outSize)")
-        return out
-
-    def _gen_encode_allocation_function(self, chre_type):
-        out = []
-        out.extend(self._gen_encode_allocation_function_signature(chre_type))
-        out.append(" {\n")
-        out.append("  CHPP_NOT_NULL(out);\n")
-        out.append("  CHPP_NOT_NULL(outSize);\n\n")
-        out.append("  size_t payloadSize = {};\n".format(
-            self._get_chpp_sizeof_call(chre_type)))
-        out.append("  *out = chppMalloc(payloadSize);\n")
-
-        out.append("  if (*out != NULL) {\n")
+            out.write("/**\n"
+                      " * Converts from given CHRE structure to serialized CHPP type.\n"
+                      " *\n"
+                      " * @param in Fully-formed CHRE structure.\n"
+                      " * @param out Upon success, will point to a buffer allocated with "
+                      "chppMalloc().\n"
+                      " * It is the responsibility of the caller to set the values of the CHPP "
+                      "app layer header, and to free the buffer when it is no longer needed via "
+                      "chppFree() or CHPP_FREE_AND_NULLIFY().\n"
+                      " * @param outSize Upon success, will be set to the size of the output "
+                      "buffer, in bytes.\n"
+                      " *\n"
+                      " * @return true on success, false if memory allocation failed.\n"
+                      " */\n")
+        out.write(f"bool {self._get_encode_allocation_function_name(chre_type)}(\n")
+        out.write(f"    const {self._get_struct_or_union_prefix(chre_type)}{chre_type} *in,\n")
+        out.write(f"    {self._get_chpp_header_type_from_chre(chre_type)} **out,\n")
+        out.write("    size_t *outSize)")
+
+    def _gen_encode_allocation_function(self, out, chre_type):
+        self._gen_encode_allocation_function_signature(out, chre_type)
+        out.write(" {\n")
+        out.write("  CHPP_NOT_NULL(out);\n")
+        out.write("  CHPP_NOT_NULL(outSize);\n\n")
+        out.write(f"  size_t payloadSize = {self._get_chpp_sizeof_call(chre_type)};\n")
+        out.write("  *out = chppMalloc(payloadSize);\n")
+
+        out.write("  if (*out != NULL) {\n")
 
         struct_info = self.api.structs_and_unions[chre_type]
         if struct_info['has_vla_member']:
-            out.append("    uint8_t *payload = (uint8_t *) &(*out)->payload;\n")
-            out.append("    uint16_t vlaOffset = sizeof({});\n".format(
-                self._get_chpp_type_from_chre(chre_type)))
+            out.write("    uint8_t *payload = (uint8_t *) &(*out)->payload;\n")
+            out.write(f"    uint16_t vlaOffset = "
+                      f"sizeof({self._get_chpp_type_from_chre(chre_type)});\n")
 
-        out.append("    {}(in, &(*out)->payload".format(
-            self._get_encoding_function_name(chre_type)))
+        out.write(f"    {self._get_encoding_function_name(chre_type)}(in, &(*out)->payload")
         if struct_info['has_vla_member']:
-            out.append(", payload, payloadSize, &vlaOffset")
-        out.append(");\n")
-        out.append("    *outSize = payloadSize;\n")
-        out.append("    return true;\n")
-        out.append("  }\n")
+            out.write(", payload, payloadSize, &vlaOffset")
+        out.write(");\n")
+        out.write("    *outSize = payloadSize;\n")
+        out.write("    return true;\n")
+        out.write("  }\n")
 
-        out.append("  return false;\n}\n\n")
-        return out
+        out.write("  return false;\n}\n\n")
 
-    def _gen_encode_allocation_functions(self):
-        out = []
+    def _gen_encode_allocation_functions(self, out):
         for chre_type in self.json['root_structs']:
-            out.extend(self._gen_encode_allocation_function(chre_type))
-        return out
+            self._gen_encode_allocation_function(out, chre_type)
 
-    def _gen_encode_allocation_function_signatures(self):
-        out = []
+    def _gen_encode_allocation_function_signatures(self, out):
         for chre_type in self.json['root_structs']:
-            out.extend(self._gen_encode_allocation_function_signature(chre_type, True))
-            out.append(";\n\n")
-        return out
+            self._gen_encode_allocation_function_signature(out, chre_type, True)
+            out.write(";\n\n")
 
     # ----------------------------------------------------------------------------------------------
     # Decoder function generation methods (CHPP --> CHRE)
     # ----------------------------------------------------------------------------------------------
 
-    def _get_decoding_function_name(self, chre_type):
+    def _get_decoding_function_name(self, chre_type: str) -> str:
         core_type_name = self._strip_prefix_and_service_from_chre_struct_name(chre_type)
-        return "chpp{}Convert{}ToChre".format(self.capitalized_service_name, core_type_name)
+        return f"chpp{self.capitalized_service_name}Convert{core_type_name}ToChre"
 
-    def _gen_decoding_function_signature(self, chre_type):
-        out = []
-        out.append("bool {}(\n".format(self._get_decoding_function_name(chre_type)))
-        out.append("    const {} *in,\n".format(self._get_chpp_type_from_chre(chre_type)))
-        out.append("    {} *out".format(self._get_chre_type_with_prefix(chre_type)))
+    def _gen_decoding_function_signature(self, out, chre_type):
+        out.write(f"bool {self._get_decoding_function_name(chre_type)}(\n")
+        out.write(f"    const {self._get_chpp_type_from_chre(chre_type)} *in,\n")
+        out.write(f"    {self._get_chre_type_with_prefix(chre_type)} *out")
         if self.api.structs_and_unions[chre_type]['has_vla_member']:
-            out.append(",\n")
-            out.append("    size_t inSize")
-        out.append(")")
-        return out
+            out.write(",\n")
+            out.write("    size_t inSize")
+        out.write(")")
 
-    def _gen_string_decoding(self, member_info, annotation):
-        out = []
+    def _gen_string_decoding(self, out, member_info, annotation):
         variable_name = member_info['name']
-        out.append("\n")
-        out.append("  if (in->{}.length == 0) {{\n".format(variable_name))
-        out.append("    out->{} = NULL;\n".format(variable_name))
-        out.append("  } else {\n")
-        out.append("    char *{}Out = chppMalloc(in->{}.length);\n".format(
-            variable_name, variable_name))
-        out.append("    if ({}Out == NULL) {{\n".format(variable_name))
-        out.append("      return false;\n")
-        out.append("    }\n\n")
-        out.append("    memcpy({}Out, &((const uint8_t *)in)[in->{}.offset],\n".format(
-            variable_name, variable_name))
-        out.append("      in->{}.length);\n".format(variable_name))
-        out.append("    out->{} = {}Out;\n".format(variable_name, variable_name))
-        out.append("  }\n")
-
-        return out
-
-
-    def _gen_vla_decoding(self, member_info, annotation):
-        out = []
-
+        out.write("\n")
+        out.write(f"  if (in->{variable_name}.length == 0) {{\n")
+        out.write(f"    out->{variable_name} = NULL;\n")
+        out.write("  } else {\n")
+        out.write(f"    char *{variable_name}Out = chppMalloc(in->{variable_name}.length);\n")
+        out.write(f"    if ({variable_name}Out == NULL) {{\n")
+        out.write("      return false;\n")
+        out.write("    }\n\n")
+        out.write(f"    memcpy({variable_name}Out, "
+                  f"&((const uint8_t *)in)[in->{variable_name}.offset],\n")
+        out.write(f"      in->{variable_name}.length);\n")
+        out.write(f"    out->{variable_name} = {variable_name}Out;\n")
+        out.write("  }\n")
+
+
+    def _gen_vla_decoding(self, out, member_info, annotation):
         variable_name = member_info['name']
         chpp_type = self._get_member_type(member_info, True)
         if member_info['is_nested_type']:
@@ -766,116 +812,99 @@ class CodeGenerator:
         else:
             chre_type = chpp_type
 
-        out.append("\n")
-        out.append("  if (in->{}.length == 0) {{\n".format(variable_name))
-        out.append("    out->{} = NULL;\n".format(variable_name))
-        out.append("  }\n")
-        out.append("  else {\n")
-        out.append("    if (in->{}.offset + in->{}.length > inSize ||\n".format(
-            variable_name, variable_name))
-        out.append("        in->{}.length != in->{} * sizeof({})) {{\n".format(
-            variable_name, annotation['length_field'], chpp_type))
+        out.write("\n")
+        out.write(f"  if (in->{variable_name}.length == 0) {{\n")
+        out.write(f"    out->{variable_name} = NULL;\n")
+        out.write("  }\n")
+        out.write("  else {\n")
+        out.write(f"    if (in->{variable_name}.offset + in->{variable_name}.length > inSize ||\n")
+        out.write(f"        in->{variable_name}.length != "
+                  f"in->{annotation['length_field']} * sizeof({chpp_type})) {{\n")
 
-        out.append("      return false;\n")
-        out.append("    }\n\n")
+        out.write("      return false;\n")
+        out.write("    }\n\n")
 
         if member_info['is_nested_type']:
-            out.append("    const {} *{}In =\n".format(chpp_type, variable_name))
-            out.append("        (const {} *) &((const uint8_t *)in)[in->{}.offset];\n\n".format(
-                chpp_type, variable_name))
+            out.write(f"    const {chpp_type} *{variable_name}In =\n")
+            out.write(f"        (const {chpp_type} *) "
+                      f"&((const uint8_t *)in)[in->{variable_name}.offset];\n\n")
 
-        out.append("    {} *{}Out = chppMalloc(in->{} * sizeof({}));\n".format(
-            chre_type, variable_name, annotation['length_field'], chre_type))
-        out.append("    if ({}Out == NULL) {{\n".format(variable_name))
-        out.append("      return false;\n")
-        out.append("    }\n\n")
+        out.write(f"    {chre_type} *{variable_name}Out = "
+                  f"chppMalloc(in->{annotation['length_field']} * sizeof({chre_type}));\n")
+        out.write(f"    if ({variable_name}Out == NULL) {{\n")
+        out.write("      return false;\n")
+        out.write("    }\n\n")
 
         if member_info['is_nested_type']:
-            out.append("    for (size_t i = 0; i < in->{}; i++) {{\n".format(
-                annotation['length_field'], variable_name))
-            out.append("      {}".format(self._get_assignment_statement_for_field(
-                member_info, in_vla_loop=True, decode_mode=True)))
-            out.append("    }\n")
+            out.write(f"    for (size_t i = 0; i < in->{annotation['length_field']}; i++) {{\n")
+            assignment = self._get_assignment_statement_for_field(
+                member_info, in_vla_loop=True, decode_mode=True)
+            out.write(f"      {assignment}")
+            out.write("    }\n")
         else:
-            out.append("    memcpy({}Out, &((const uint8_t *)in)[in->{}.offset],\n".format(
-                variable_name, variable_name))
-            out.append("      in->{} * sizeof({}));\n".format(
-                annotation['length_field'], chre_type))
+            out.write(f"    memcpy({variable_name}Out, "
+                      f"&((const uint8_t *)in)[in->{variable_name}.offset],\n")
+            out.write(f"      in->{annotation['length_field']} * sizeof({chre_type}));\n")
 
-        out.append("    out->{} = {}Out;\n".format(variable_name, variable_name))
-        out.append("  }\n\n")
+        out.write(f"    out->{variable_name} = {variable_name}Out;\n")
+        out.write("  }\n\n")
 
-        return out
-
-    def _get_decode_allocation_function_name(self, chre_type):
+    def _get_decode_allocation_function_name(self, chre_type: str) -> str:
         core_type_name = self._strip_prefix_and_service_from_chre_struct_name(chre_type)
-        return "chpp{}{}ToChre".format(self.capitalized_service_name, core_type_name)
+        return f"chpp{self.capitalized_service_name}{core_type_name}ToChre"
 
-    def _gen_decode_allocation_function_signature(self, chre_type, gen_docs=False):
-        out = []
+    def _gen_decode_allocation_function_signature(self, out, chre_type, gen_docs=False):
         if gen_docs:
-            out.append("/**\n"
-                       " * Converts from serialized CHPP structure to a CHRE type.\n"
-                       " *\n"
-                       " * @param in Fully-formed CHPP structure.\n"
-                       " * @param in Size of the CHPP structure in bytes.\n"
-                       " *\n"
-                       " * @return If successful, a pointer to a CHRE structure allocated with "
-                       "chppMalloc(). If unsuccessful, null.\n"
-                       " * It is the responsibility of the caller to free the buffer when it is no "
-                       "longer needed via chppFree() or CHPP_FREE_AND_NULLIFY().\n"
-                       " */\n")
-
-        out.append("{} *{}(\n".format(
-            self._get_chre_type_with_prefix(chre_type),
-            self._get_decode_allocation_function_name(chre_type)))
-        out.append("    const {} *in,\n".format(self._get_chpp_type_from_chre(chre_type)))
-        out.append("    size_t inSize)")
-        return out
-
-    def _gen_decode_allocation_function(self, chre_type):
-        out = []
-
-        out.extend(self._gen_decode_allocation_function_signature(chre_type))
-        out.append(" {\n")
-
-        out.append("  {} *out = NULL;\n\n".format(
-            self._get_chre_type_with_prefix(chre_type)))
-
-        out.append("  if (inSize >= sizeof({})) {{\n".format(
-            self._get_chpp_type_from_chre(chre_type)))
-
-        out.append("    out = chppMalloc(sizeof({}));\n".format(
-            self._get_chre_type_with_prefix(chre_type)))
-        out.append("    if (out != NULL) {\n")
+            out.write("/**\n"
+                      " * Converts from serialized CHPP structure to a CHRE type.\n"
+                      " *\n"
+                      " * @param in Fully-formed CHPP structure.\n"
+                      " * @param in Size of the CHPP structure in bytes.\n"
+                      " *\n"
+                      " * @return If successful, a pointer to a CHRE structure allocated with "
+                      "chppMalloc(). If unsuccessful, null.\n"
+                      " * It is the responsibility of the caller to free the buffer when it is no "
+                      "longer needed via chppFree() or CHPP_FREE_AND_NULLIFY().\n"
+                      " */\n")
+
+        out.write(f"{self._get_chre_type_with_prefix(chre_type)} "
+                  f"*{self._get_decode_allocation_function_name(chre_type)}(\n")
+        out.write(f"    const {self._get_chpp_type_from_chre(chre_type)} *in,\n")
+        out.write("    size_t inSize)")
+
+    def _gen_decode_allocation_function(self, out, chre_type):
+        self._gen_decode_allocation_function_signature(out, chre_type)
+        out.write(" {\n")
+
+        out.write(f"  {self._get_chre_type_with_prefix(chre_type)} *out = NULL;\n\n")
+
+        out.write(f"  if (inSize >= sizeof({self._get_chpp_type_from_chre(chre_type)})) {{\n")
+
+        out.write(f"    out = chppMalloc(sizeof({self._get_chre_type_with_prefix(chre_type)}));\n")
+        out.write("    if (out != NULL) {\n")
 
         struct_info = self.api.structs_and_unions[chre_type]
 
-        out.append("      if (!{}(in, out".format(self._get_decoding_function_name(chre_type)))
+        out.write(f"      if (!{self._get_decoding_function_name(chre_type)}(in, out")
         if struct_info['has_vla_member']:
-            out.append(", inSize")
-        out.append(")) {")
-        out.append("        CHPP_FREE_AND_NULLIFY(out);\n")
-        out.append("      }\n")
-
-        out.append("    }\n")
-        out.append("  }\n\n")
-        out.append("  return out;\n")
-        out.append("}\n")
-        return out
-
-    def _gen_decode_allocation_functions(self):
-        out = []
+            out.write(", inSize")
+        out.write(")) {")
+        out.write("        CHPP_FREE_AND_NULLIFY(out);\n")
+        out.write("      }\n")
+
+        out.write("    }\n")
+        out.write("  }\n\n")
+        out.write("  return out;\n")
+        out.write("}\n")
+
+    def _gen_decode_allocation_functions(self, out):
         for chre_type in self.json['root_structs']:
-            out.extend(self._gen_decode_allocation_function(chre_type))
-        return out
+            self._gen_decode_allocation_function(out, chre_type)
 
-    def _gen_decode_allocation_function_signatures(self):
-        out = []
+    def _gen_decode_allocation_function_signatures(self, out):
         for chre_type in self.json['root_structs']:
-            out.extend(self._gen_decode_allocation_function_signature(chre_type, True))
-            out.append(";\n\n")
-        return out
+            self._gen_decode_allocation_function_signature(out, chre_type, True)
+            out.write(";\n\n")
 
     # ----------------------------------------------------------------------------------------------
     # Public methods
@@ -885,7 +914,7 @@ class CodeGenerator:
         """Creates a C header file for this API and writes it to the file indicated in the JSON."""
         filename = self.service_name + "_types.h"
         if not dry_run:
-            print("Generating {} ... ".format(filename), end='', flush=True)
+            print(f"Generating {filename} ... ", end='', flush=True)
         output_file = os.path.join(system_chre_abs_path(), CHPP_PARSER_INCLUDE_PATH, filename)
         header = self.generate_header_string()
         self._dump_to_file(output_file, header, dry_run, skip_clang_format)
@@ -894,33 +923,33 @@ class CodeGenerator:
 
     def generate_header_string(self):
         """Returns a C header with structure definitions for this API."""
-        # To defer concatenation (speed things up), build the file as a list of strings then only
-        # concatenate once at the end
-        out = [LICENSE_HEADER]
+        # Build the file in a single StringIO buffer to avoid repeated string concatenation
+        out = io.StringIO()
+        out.write(LICENSE_HEADER)
 
-        header_guard = "CHPP_{}_TYPES_H_".format(self.service_name.upper())
+        header_guard = f"CHPP_{self.service_name.upper()}_TYPES_H_"
 
-        out.append("#ifndef {}\n#define {}\n\n".format(header_guard, header_guard))
-        out.extend(self._autogen_notice())
-        out.extend(self._gen_header_includes())
-        out.append("#ifdef __cplusplus\nextern \"C\" {\n#endif\n\n")
-        out.extend(self._gen_structs_and_unions())
+        out.write(f"#ifndef {header_guard}\n#define {header_guard}\n\n")
+        self._autogen_notice(out)
+        self._gen_header_includes(out)
+        out.write("#ifdef __cplusplus\nextern \"C\" {\n#endif\n\n")
+        self._gen_structs_and_unions(out)
 
-        out.append("\n// Encoding functions (CHRE --> CHPP)\n\n")
-        out.extend(self._gen_encode_allocation_function_signatures())
+        out.write("\n// Encoding functions (CHRE --> CHPP)\n\n")
+        self._gen_encode_allocation_function_signatures(out)
 
-        out.append("\n// Decoding functions (CHPP --> CHRE)\n\n")
-        out.extend(self._gen_decode_allocation_function_signatures())
+        out.write("\n// Decoding functions (CHPP --> CHRE)\n\n")
+        self._gen_decode_allocation_function_signatures(out)
 
-        out.append("#ifdef __cplusplus\n}\n#endif\n\n")
-        out.append("#endif  // {}\n".format(header_guard))
-        return ''.join(out)
+        out.write("#ifdef __cplusplus\n}\n#endif\n\n")
+        out.write(f"#endif  // {header_guard}\n")
+        return out.getvalue()
 
     def generate_conversion_file(self, dry_run=False, skip_clang_format=False):
         """Generates a .c file with functions for encoding CHRE structs into CHPP and vice versa."""
         filename = self.service_name + "_convert.c"
         if not dry_run:
-            print("Generating {} ... ".format(filename), end='', flush=True)
+            print(f"Generating {filename} ... ", end='', flush=True)
         contents = self.generate_conversion_string()
         output_file = os.path.join(system_chre_abs_path(), CHPP_PARSER_SOURCE_PATH, filename)
         self._dump_to_file(output_file, contents, dry_run, skip_clang_format)
@@ -929,24 +958,26 @@ class CodeGenerator:
 
     def generate_conversion_string(self):
         """Returns C code for encoding CHRE structs into CHPP and vice versa."""
-        out = [LICENSE_HEADER, "\n"]
+        out = io.StringIO()
+        out.write(LICENSE_HEADER)
+        out.write("\n")
 
-        out.extend(self._autogen_notice())
-        out.extend(self._gen_conversion_includes())
+        self._autogen_notice(out)
+        self._gen_conversion_includes(out)
 
-        out.append("\n// Encoding (CHRE --> CHPP) size functions\n\n")
-        out.extend(self._gen_chpp_sizeof_functions())
-        out.append("\n// Encoding (CHRE --> CHPP) conversion functions\n\n")
-        out.extend(self._gen_conversion_functions(False))
-        out.append("\n// Encoding (CHRE --> CHPP) top-level functions\n\n")
-        out.extend(self._gen_encode_allocation_functions())
+        out.write("\n// Encoding (CHRE --> CHPP) size functions\n\n")
+        self._gen_chpp_sizeof_functions(out)
+        out.write("\n// Encoding (CHRE --> CHPP) conversion functions\n\n")
+        self._gen_conversion_functions(out, False)
+        out.write("\n// Encoding (CHRE --> CHPP) top-level functions\n\n")
+        self._gen_encode_allocation_functions(out)
 
-        out.append("\n// Decoding (CHPP --> CHRE) conversion functions\n\n")
-        out.extend(self._gen_conversion_functions(True))
-        out.append("\n// Decoding (CHPP --> CHRE) top-level functions\n\n")
-        out.extend(self._gen_decode_allocation_functions())
+        out.write("\n// Decoding (CHPP --> CHRE) conversion functions\n\n")
+        self._gen_conversion_functions(out, True)
+        out.write("\n// Decoding (CHPP --> CHRE) top-level functions\n\n")
+        self._gen_decode_allocation_functions(out)
 
-        return ''.join(out)
+        return out.getvalue()
 
 
 class ApiParser:
@@ -965,43 +996,59 @@ class ApiParser:
         self._parse_api()
 
     def _parse_annotations(self):
-        # Convert annotations list to a more usable data structure: dict keyed by structure name,
-        # containing a dict keyed by field name, containing a list of annotations (as they
-        # appear in the JSON). In other words, we can easily get all of the annotations for the
-        # "version" field in "chreWwanCellInfoResult" via
-        # annotations['chreWwanCellInfoResult']['version']. This is also a defaultdict, so it's safe
-        # to access if there are no annotations for this structure + field; it'll just give you
-        # an empty list in that case.
-        self.annotations = defaultdict(lambda: defaultdict(list))
+        # Convert annotations list to a more usable data structure: a flat dict keyed by
+        # (structure name, field name), containing a list of annotations (as they appear in the
+        # JSON). In other words, we can easily get all of the annotations for the "version"
+        # field in "chreWwanCellInfoResult" via
+        # annotations[('chreWwanCellInfoResult', 'version')]. Fields with no annotations (the
+        # common case) aren't present; readers use .get() with an empty default.
+        # Also collect the names of structs that directly contain a variable-length array
+        # member, so has_vla_member can be seeded with a set lookup per struct instead of
+        # rescanning each member's annotations.
+        self.annotations = {}
+        self.vla_structs = set()
         for struct_info in self.json['struct_info']:
             for annotation in struct_info['annotations']:
-                self.annotations[struct_info['name']][annotation['field']].append(annotation)
+                self.annotations.setdefault(
+                    (struct_info['name'], annotation['field']), []).append(annotation)
+                if annotation['annotation'] == "var_len_array":
+                    self.vla_structs.add(struct_info['name'])
+        # The annotation lists are never mutated after this point; freeze them to tuples, which
+        # are smaller (no append over-allocation) and slightly faster to iterate
+        self.annotations = {key: tuple(value) for key, value in self.annotations.items()}
 
     def _files_to_parse(self):
         """Returns a list of files to supply as input to CParser"""
-        # Input paths for CParser are stored in JSON relative to <android_root>/system/chre
-        # Reformulate these to absolute paths, and add in some default includes that we always
-        # supply
-        chre_project_base_dir = system_chre_abs_path()
-        default_includes = ["chpp/api_parser/parser_defines.h",
-                            "chre_api/include/chre_api/chre/version.h"]
-        files = default_includes + self.json['includes'] + [self.json['filename']]
-        return [os.path.join(chre_project_base_dir, file) for file in files]
+        return _files_to_parse(self.json)
+
+    def __getstate__(self):
+        # Drop the CParser instance when pickling: it holds parser machinery that isn't needed
+        # once parsing completes
+        state = self.__dict__.copy()
+        state.pop('parser', None)
+        return state
 
     def _parse_structs_and_unions(self):
         # Starting with the root structures (i.e. those that will appear at the top-level in one
         # or more CHPP messages), build a data structure containing all of the information we'll
         # need to emit the CHPP structure definition and conversion code.
-        structs_and_unions_to_parse = self.json['root_structs'].copy()
-        while len(structs_and_unions_to_parse) > 0:
+        # Type names recur throughout the graph (dict keys, dependency/appears_in sets, the
+        # worklist), so intern them where they enter: membership tests can then short-circuit
+        # on identity and each name is stored once
+        structs_and_unions_to_parse = {sys.intern(name) for name in self.json['root_structs']}
+        # Reverse linkage of the dependency chain (i.e. lookup between a type and the other types
+        # it appears in), built alongside the forward edges. Kept in a side map until the loop
+        # finishes since a type can be referenced before its own entry exists.
+        appears_in = {}
+        while structs_and_unions_to_parse:
             type_name = structs_and_unions_to_parse.pop()
-            if type_name in self.structs_and_unions:
-                continue
 
             entry = {
                 'appears_in': set(),  # Other types this type is nested within
                 'dependencies': set(),  # Types that are nested in this type
-                'has_vla_member': False,  # True if this type or any dependency has a VLA member
+                # True if this type or any dependency has a VLA member (the dependency part is
+                # propagated after the parse loop)
+                'has_vla_member': type_name in self.vla_structs,
                 'members': [],  # Info about each member of this type
             }
             if type_name in self.parser.defs['structs']:
@@ -1011,62 +1058,168 @@ class ApiParser:
                 defs = self.parser.defs['unions'][type_name]
                 entry['is_union'] = True
             else:
-                raise RuntimeError("Couldn't find {} in parsed structs/unions".format(type_name))
+                raise RuntimeError(f"Couldn't find {type_name} in parsed structs/unions")
 
             for member_name, member_type, _ in defs['members']:
+                annotations = self.annotations.get((type_name, member_name), ())
                 member_info = {
                     'name': member_name,
                     'type': member_type,
-                    'annotations': self.annotations[type_name][member_name],
+                    'annotations': annotations,
                     'is_nested_type': False,
                 }
 
-                if member_type.type_spec.startswith('struct ') or \
-                        member_type.type_spec.startswith('union '):
+                kind, _, member_type_name = member_type.type_spec.partition(' ')
+                if kind in ('struct', 'union'):
+                    member_type_name = sys.intern(member_type_name)
                     member_info['is_nested_type'] = True
-                    member_type_name = member_type.type_spec.split(' ')[1]
                     member_info['nested_type_name'] = member_type_name
                     entry['dependencies'].add(member_type_name)
-                    structs_and_unions_to_parse.append(member_type_name)
+                    appears_in.setdefault(member_type_name, set()).add(type_name)
+                    # The set dedupes re-discoveries of a type still waiting to be parsed;
+                    # just don't re-queue types that have already been parsed
+                    if member_type_name not in self.structs_and_unions:
+                        structs_and_unions_to_parse.add(member_type_name)
 
                 entry['members'].append(member_info)
 
-                # Flip a flag if this structure has at least one variable-length array member, which
-                # means that the encoded size can only be computed at runtime
-                if not entry['has_vla_member']:
-                    for annotation in self.annotations[type_name][member_name]:
-                        if annotation['annotation'] == "var_len_array":
-                            entry['has_vla_member'] = True
-
+            # Complete - freeze the member list too
+            entry['members'] = tuple(entry['members'])
             self.structs_and_unions[type_name] = entry
 
-        # Build reverse linkage of dependency chain (i.e. lookup between a type and the other types
-        # it appears in)
-        for type_name, type_info in self.structs_and_unions.items():
-            for dependency in type_info['dependencies']:
-                self.structs_and_unions[dependency]['appears_in'].add(type_name)
-
-        # Bubble up "has_vla_member" to types each type it appears in, i.e. if this flag is set to
-        # True on a leaf node, then all its ancestors should also have the flag set to True
-        for type_name, type_info in self.structs_and_unions.items():
-            if type_info['has_vla_member']:
-                types_to_mark = list(type_info['appears_in'])
-                while len(types_to_mark) > 0:
-                    type_to_mark = types_to_mark.pop()
-                    self.structs_and_unions[type_to_mark]['has_vla_member'] = True
-                    types_to_mark.extend(list(self.structs_and_unions[type_to_mark]['appears_in']))
+        for type_name, parents in appears_in.items():
+            self.structs_and_unions[type_name]['appears_in'] = parents
+
+        # Bubble up "has_vla_member" to the types each type appears in, i.e. if this flag is set
+        # to True on a leaf node, then all its ancestors should also have the flag set to True.
+        # Propagate in reverse-topological (Kahn) order - a type is processed only once all of
+        # its dependencies hold their final flag value - so each edge is visited exactly once.
+        pending_deps = {type_name: len(type_info['dependencies'])
+                        for type_name, type_info in self.structs_and_unions.items()}
+        ready = deque(type_name for type_name, count in pending_deps.items() if count == 0)
+        while ready:
+            type_name = ready.popleft()
+            type_info = self.structs_and_unions[type_name]
+            for parent in type_info['appears_in']:
+                if type_info['has_vla_member']:
+                    self.structs_and_unions[parent]['has_vla_member'] = True
+                pending_deps[parent] -= 1
+                if pending_deps[parent] == 0:
+                    ready.append(parent)
 
     def _parse_api(self):
         file_to_parse = self._files_to_parse()
-        self.parser = CParser(file_to_parse, cache='parser_cache')
+
+        # Cache the parsed definitions keyed by the input files' contents, so unchanged headers
+        # skip the CParser run entirely even when the ApiParser-level cache misses (e.g. because
+        # only the annotations JSON changed). Only defs is kept; it's all the parse consumes.
+        hasher = hashlib.sha1()
+        for path in file_to_parse:
+            with open(path, 'rb') as f:
+                hasher.update(f.read())
+        cache_file = os.path.join(_API_CACHE_DIR,
+                                  f"cparser-v{_API_CACHE_VERSION}-{hasher.hexdigest()}.pkl")
+        try:
+            with open(cache_file, 'rb') as f:
+                self.parser = types.SimpleNamespace(defs=pickle.load(f))
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            # Each file entry gets its own CParser cache file so parallel workers never write
+            # to the same cache concurrently
+            service_name = os.path.splitext(os.path.basename(self.json['filename']))[0]
+            self.parser = CParser(file_to_parse, cache=f'parser_cache_{service_name}')
+            os.makedirs(_API_CACHE_DIR, exist_ok=True)
+            with open(cache_file, 'wb') as f:
+                pickle.dump(self.parser.defs, f)
+
         self._parse_structs_and_unions()
 
 
-def run(args):
-    with open('chre_api_annotations.json') as f:
-        js = json.load(f)
+# Includes that we always supply as input to CParser, resolved to absolute paths once at
+# import time since they're the same for every file entry
+_DEFAULT_INCLUDE_PATHS = [os.path.join(system_chre_abs_path(), file)
+                          for file in ("chpp/api_parser/parser_defines.h",
+                                       "chre_api/include/chre_api/chre/version.h")]
+
 
-    commit_hash = subprocess.getoutput("git describe --always --long --dirty --exclude '*'")
+def _files_to_parse(json_obj):
+    """Returns a list of files to supply as input to CParser for a JSON file entry"""
+    # Input paths for CParser are stored in JSON relative to <android_root>/system/chre
+    # Reformulate these to absolute paths, and prepend the default includes
+    chre_project_base_dir = system_chre_abs_path()
+    files = json_obj['includes'] + [json_obj['filename']]
+    return _DEFAULT_INCLUDE_PATHS + [os.path.join(chre_project_base_dir, file) for file in files]
+
+
+# Directory holding pickled ApiParser state, keyed by a hash of the inputs that produced it.
+# Bump the version whenever the parsed data structures change shape, so stale caches are ignored.
+_API_CACHE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '.chre_api_cache')
+_API_CACHE_VERSION = 3
+
+
+def _api_parser_cache_file(json_obj):
+    """Returns the cache file path for a JSON file entry, keyed by its inputs' contents"""
+    hasher = hashlib.sha1()
+    hasher.update(json.dumps(json_obj, sort_keys=True).encode('utf-8'))
+    for path in _files_to_parse(json_obj):
+        with open(path, 'rb') as f:
+            hasher.update(f.read())
+    return os.path.join(_API_CACHE_DIR, f"v{_API_CACHE_VERSION}-{hasher.hexdigest()}.pkl")
+
+
+def _load_or_parse_api(json_obj):
+    """Returns an ApiParser for the given JSON file entry, skipping the parse on a cache hit"""
+    cache_file = _api_parser_cache_file(json_obj)
+    try:
+        with open(cache_file, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        pass
+
+    api_parser = ApiParser(json_obj)
+    os.makedirs(_API_CACHE_DIR, exist_ok=True)
+    with open(cache_file, 'wb') as f:
+        pickle.dump(api_parser, f)
+    return api_parser
+
+
+def _run_clang_format(paths):
+    """Runs clang-format in-place over the given files in a single invocation.
+
+    Batching amortizes process startup cost over all generated files.
+    """
+    if not paths:
+        return
+    clang_format_path = os.path.normpath(
+        "../../../../prebuilts/clang/host/linux-x86/clang-stable/bin/clang-format")
+    result = subprocess.run([clang_format_path, '-i'] + paths)
+    result.check_returncode()
+
+
+def _process_file(file, dry_run, skip_clang_format):
+    """Runs the full parse + generate pipeline for one annotations file entry.
+
+    Kept at module level so ProcessPoolExecutor workers can pickle it.
+    Returns the list of written files that still need a clang-format pass, so the
+    parent process can format the outputs of all workers in one invocation.
+    """
+    print(f"Parsing {file['filename']} ... ", end='', flush=True)
+    api_parser = _load_or_parse_api(file)
+    code_gen = CodeGenerator(api_parser)
+    print("done")
+    code_gen.generate_header_file(dry_run, skip_clang_format)
+    code_gen.generate_conversion_file(dry_run, skip_clang_format)
+    return code_gen.pending_format_files()
+
+
+def run(args):
+    if orjson is not None:
+        with open('chre_api_annotations.json', 'rb') as f:
+            js = orjson.loads(f.read())
+    else:
+        with open('chre_api_annotations.json') as f:
+            js = json.load(f)
+
+    files = []
     for file in js:
         if args.file_filter:
             matched = False
@@ -1075,15 +1228,26 @@ def run(args):
                     matched = True
                     break
             if not matched:
-                print("Skipping {} - doesn't match filter(s) {}".format(file['filename'],
-                                                                        args.file_filter))
+                print(f"Skipping {file['filename']} - doesn't match filter(s) "
+                      f"{args.file_filter}")
                 continue
-        print("Parsing {} ... ".format(file['filename']), end='', flush=True)
-        api_parser = ApiParser(file)
-        code_gen = CodeGenerator(api_parser, commit_hash)
-        print("done")
-        code_gen.generate_header_file(args.dry_run, args.skip_clang_format)
-        code_gen.generate_conversion_file(args.dry_run, args.skip_clang_format)
+        files.append(file)
+
+    pending_format_files = []
+    if args.dry_run or len(files) <= 1:
+        # Keep dry runs (and trivial runs) sequential so the printed output stays deterministic
+        for file in files:
+            pending_format_files += _process_file(file, args.dry_run, args.skip_clang_format)
+    else:
+        # Each file entry is fully independent, so fan the work out across cores
+        with concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            futures = [executor.submit(_process_file, file, args.dry_run, args.skip_clang_format)
+                       for file in files]
+            for future in concurrent.futures.as_completed(futures):
+                pending_format_files += future.result()
+
+    # Format everything written in this run - by all workers - with one clang-format invocation
+    _run_clang_format(pending_format_files)
 
 
 if __name__ == "__main__":